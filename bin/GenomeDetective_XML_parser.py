@@ -15,23 +15,33 @@
 # | ------ | --------- | ----------- | ----------------- | --------------- | ----------- | ------ |
 # | ...    | ...       | ...         | ...               | ...             | ...         | ...    |
 # 
+# followed by the runtime of each Genome Detective stage (init, qc1, qc2, filtering),
+# the number of high quality reads (that go into DIAMOND filtering) and the speed
+# (reads per second) of quality control (qc1 + qc2) and of filtering.
+# 
 # Required python packages:
 #  - lxml
 #  - icu
 #  - pandas
+#  - pyarrow (only for parquet output)
 #  
 # For automatic use in snakemake. The corresponding snakemake rule should provide the input:
 #  - a list of XML files (their names, as strings; e.g. [ "1_a_results.xml", "1_b_results.xml" ]
 #  - a name for the output (e.g. "tmp/GenomeDetective_results.csv")
+#    The output is written as parquet if the name ends with ".parquet", otherwise as csv.
 
 #Import required python libraries --------------------------
 from lxml import etree      #XML parser
 import pandas as pd         #dataframe and csv export
+from GenomeDetective_tables import write_table #csv/parquet tables
 from collections import defaultdict
 
 XML_FILES = snakemake.input
 OUTPUT_FILE = snakemake.output[0]
 
+#The stages (blocks) in the XML file, in order
+STAGES = ["init", "qc1", "qc2", "filtering"]
+
 #Parser functions ------------------------------------------
 
 def pull_sample_name(filename):
@@ -57,6 +67,15 @@ Please provide sample names in this format.
     
     return run_id, sample_id
 
+def reads_per_second(reads, seconds):
+    """
+    Divide the number of reads by the runtime, if there is one
+    """
+    if not seconds:
+        return None
+    else:
+        return reads / seconds
+
 def parse_xml(filename):
     """
     parse Genome Detective XML output files
@@ -69,6 +88,8 @@ def parse_xml(filename):
      - number of viral reads (as identified by DIAMOND)
      - number of non-viral reads (as identified by DIAMOND)
      - total runtime (in milliseconds -> converted to seconds)
+     - runtime of each stage (init, qc1, qc2, filtering; in seconds)
+       from the first start-time to the last end-time in that block
     """
     init = True         #for finding start_time
     finished = False    #for finding end_time
@@ -79,6 +100,9 @@ def parse_xml(filename):
     
     viral_reads = 0
     #sum all reads with "Viruses" in their taxonomy, starting from 0
+    
+    stage_times = {stage : [None, None] for stage in STAGES}
+    #[start_time, end_time] of each stage
         
     context = etree.iterparse(filename)
     
@@ -103,6 +127,16 @@ def parse_xml(filename):
         else:
             pass
         
+        #Search for the start and end times of the stages
+        if elem.tag in ["start-time", "end-time"]:
+            for stage, active in zip(STAGES, [init, qc1, qc2, filtering]):
+                if not active:
+                    continue
+                if elem.tag == "start-time" and stage_times[stage][0] is None:
+                    stage_times[stage][0] = int(elem.text)
+                elif elem.tag == "end-time":
+                    stage_times[stage][1] = int(elem.text)
+        
         #Search for start_time
         if init and elem.tag == "start-time":
             start_time = int(elem.text)
@@ -149,11 +183,31 @@ def parse_xml(filename):
     
     non_viral_reads = total_reads - low_quality_reads - viral_reads
     
-    return {"total_reads" : total_reads,
-            "low_quality_reads" : low_quality_reads, 
-            "non_viral_reads" : non_viral_reads, 
-            "viral_reads" : viral_reads, 
-            "runtime" : runtime}
+    results = {"total_reads" : total_reads,
+               "low_quality_reads" : low_quality_reads, 
+               "non_viral_reads" : non_viral_reads, 
+               "viral_reads" : viral_reads, 
+               "runtime" : runtime,
+               "high_quality_reads" : high_quality_reads}
+    
+    #Stage runtimes, also in seconds (None if a time is missing)
+    for stage, (stage_start, stage_end) in stage_times.items():
+        if stage_start is None or stage_end is None:
+            results["%s_runtime" % stage] = None
+        else:
+            results["%s_runtime" % stage] = ( stage_end - stage_start ) / 1000
+    
+    #Throughput of quality control (all reads) and DIAMOND filtering
+    # (high quality reads only)
+    if results["qc1_runtime"] is not None and results["qc2_runtime"] is not None:
+        results["qc_reads_per_second"] = reads_per_second(
+            total_reads, results["qc1_runtime"] + results["qc2_runtime"])
+    else:
+        results["qc_reads_per_second"] = None
+    results["filtering_reads_per_second"] = reads_per_second(
+        high_quality_reads, results["filtering_runtime"])
+    
+    return results
 
 def aggregate_results(file_list):
     """
@@ -202,15 +256,22 @@ if __name__ == "__main__":
     #Parse/collect the results in a Pandas dataframe
     results_df = aggregate_results(XML_FILES)
     
+    #The run ID is numeric: store it as such, so that it matches
+    # the other tables in binary formats too (csv loses the type anyway)
+    results_df["run_id"] = results_df["run_id"].apply(int)
+    
     #Reorder the columns
     columns = ["run_id", "sample_id", "total_reads", 
                "low_quality_reads", "non_viral_reads",
-               "viral_reads", "runtime"]
+               "viral_reads", "runtime", "init_runtime",
+               "qc1_runtime", "qc2_runtime", "filtering_runtime",
+               "high_quality_reads", "qc_reads_per_second",
+               "filtering_reads_per_second"]
     results_df = results_df[columns]
     
-    #And save it as a csv file
-    results_df.to_csv(OUTPUT_FILE, index = False)
+    #And save it as a csv (or parquet) file
+    write_table(results_df, OUTPUT_FILE)
     
     print("""\nDone!
-The results have been written to: GenomeDetective_results.csv""")
+The results have been written to: %s""" % OUTPUT_FILE)
 
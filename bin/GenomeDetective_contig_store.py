@@ -0,0 +1,174 @@
+
+# coding: utf-8
+
+# # Genome Detective contig store
+#
+# The "Contigs" column of the Genome Detective result CSV files is long,
+# so it is left out of the tables in this pipeline. This script moves it
+# into a separate, compact store: an SQLite database with one
+# (zlib-compressed) entry per run, sample and taxon, indexed on
+# (run_id, sample_id, assignment). Looking up the contigs of one taxon
+# in one sample is then an index lookup, instead of reading all CSV files.
+#
+# Input: result CSV files as generated by [GenomeDetective](http://www.genomedetective.com/app/typingtool/virus/)
+#     a. Assignments
+#     b. Discoveries
+#
+# Output: SQLite database (e.g. "tmp/GenomeDetective_contigs.sqlite") with the table:
+#
+# | run_id | sample_id | assignment | assigned_discovered | contigs |
+# | ------ | --------- | ---------- | ------------------- | ------- |
+# | ...    | ...       | ...        | ...                 | ...     |
+#
+# Required python packages:
+#  - pandas
+#
+# For automatic use in snakemake. The corresponding snakemake rule should provide the input:
+#  - a list of CSV files (their names, as strings; e.g. [ "1_a_results.csv", "1_b_results.csv" ]; also for the discovery)
+#  - a name for the output (e.g. "tmp/GenomeDetective_contigs.sqlite")
+#
+# To look up contigs afterwards, run the script from the command line, e.g.:
+#  python bin/GenomeDetective_contig_store.py tmp/GenomeDetective_contigs.sqlite 3 1 "Human mastadenovirus F"
+# Leave out the taxon to list the taxa of that sample.
+
+#Import required python libraries-------------------------------
+import argparse
+import sqlite3
+import zlib
+import pandas as pd         #reading csv files
+
+
+#Define functions-----------------------------------------------
+def pull_sample_name(filename):
+    """
+    The sample and run IDs are in the filename, e.g.:
+    "3_10_results.xml"
+    where the 3 is the run ID, and the 10 is the sample ID
+    """
+    error_msg = """
+Expected underscores in the filename with the sample ID, e.g.
+3_1_results.xml
+Please provide sample names in this format.
+    """
+
+    assert filename.count('_') >= 2,         "%s" % error_msg
+
+    run_id = filename.split('/')[-1].split('_')[0]
+
+    if filename.count('_') > 2:
+        sample_id = '_'.join(filename.split('/')[-1].split('_')[1:-1])
+    else:
+        sample_id = filename.split('/')[-1].split('_')[1]
+
+    return run_id, sample_id
+
+def create_store(filename):
+    """
+    Create (or open) the contig store, with one row per
+    run, sample, taxon and assigned/discovered. The table is
+    clustered on these keys (WITHOUT ROWID), so a lookup is one
+    index seek.
+    """
+    connection = sqlite3.connect(filename)
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS contigs (
+            run_id TEXT NOT NULL,
+            sample_id TEXT NOT NULL,
+            assignment TEXT NOT NULL,
+            assigned_discovered TEXT NOT NULL,
+            contigs BLOB,
+            PRIMARY KEY (run_id, sample_id, assignment, assigned_discovered)
+        ) WITHOUT ROWID""")
+
+    return(connection)
+
+def compress_contigs(contigs):
+    """
+    Compress the contigs of one taxon; missing contigs are stored as NULL
+    """
+    if pd.isnull(contigs):
+        return None
+    else:
+        return sqlite3.Binary(zlib.compress(str(contigs).encode("utf-8")))
+
+def store_contigs(connection, csv_list, assigned_discovered):
+    """
+    Input: connection to the contig store, a list of Genome Detective
+        output CSV files, and whether these are "Assigned" or "Discovered"
+    Output: None, the contigs are written to the store
+
+    The store is made from scratch in each run of the pipeline
+    (Snakemake removes the old one first).
+    """
+    for results_file in sorted(csv_list):
+        results_df = pd.read_csv(results_file, usecols = ["Assignment", "Contigs"])
+        run_id, sample_id = pull_sample_name(results_file)
+
+        rows = [ (run_id, sample_id, assignment, assigned_discovered,
+                  compress_contigs(contigs))
+                 for assignment, contigs in zip(results_df["Assignment"],
+                                                results_df["Contigs"]) ]
+
+        connection.executemany("INSERT OR REPLACE INTO contigs VALUES (?, ?, ?, ?, ?)",
+                               rows)
+
+    connection.commit()
+    return(None)
+
+def lookup_contigs(connection, run_id, sample_id, assignment = None):
+    """
+    Input: connection to the contig store, run ID, sample ID and
+        (optionally) taxon
+    Output: list of (taxon, assigned/discovered, contigs) tuples
+        for this sample; for one taxon only if it is given
+        (contigs is None if they were missing)
+    """
+    query = """SELECT assignment, assigned_discovered, contigs FROM contigs
+        WHERE run_id = ? AND sample_id = ?"""
+    parameters = [str(run_id), str(sample_id)]
+
+    if assignment is not None:
+        query += " AND assignment = ?"
+        parameters.append(assignment)
+
+    return([ (taxon, kind, None if contigs is None
+                           else zlib.decompress(contigs).decode("utf-8"))
+             for taxon, kind, contigs in connection.execute(query, parameters) ])
+
+
+#Script execution------------------------------------------------
+if __name__ == "__main__":
+    if "snakemake" in globals():
+        #Ingest step of the pipeline
+        ASSIGNMENTS = snakemake.input['assignments']
+        DISCOVERIES = snakemake.input['discoveries']
+        OUTPUT_FILE = snakemake.output[0]
+
+        connection = create_store(OUTPUT_FILE)
+        store_contigs(connection, ASSIGNMENTS, "Assigned")
+        store_contigs(connection, DISCOVERIES, "Discovered")
+        connection.close()
+
+        print("""\nDone!
+The contigs have been written to: %s""" % OUTPUT_FILE)
+
+    else:
+        #Look up contigs from the command line
+        parser = argparse.ArgumentParser(
+            description = "Look up the contigs of a sample in the contig store")
+        parser.add_argument("store", help = "contig store (.sqlite)")
+        parser.add_argument("run_id", help = "run ID")
+        parser.add_argument("sample_id", help = "sample ID")
+        parser.add_argument("taxon", nargs = "?", default = None,
+                            help = "taxon (Genome Detective assignment)")
+        args = parser.parse_args()
+
+        connection = sqlite3.connect(args.store)
+        for taxon, kind, contigs in lookup_contigs(connection, args.run_id,
+                                                   args.sample_id, args.taxon):
+            if args.taxon is None:
+                print("%s\t%s" % (taxon, kind))
+            else:
+                print("# %s (%s)\n%s" % (taxon, kind,
+                    "(no contigs)" if contigs is None else contigs))
+        connection.close()
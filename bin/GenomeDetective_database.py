@@ -0,0 +1,240 @@
+
+# coding: utf-8
+
+# # Genome Detective cohort database
+#
+# Collects the results of all runs in one local SQLite database, so that
+# questions about earlier runs (e.g. "which samples had taxon X above 1%?")
+# can be answered without running the pipeline again or loading all tables.
+# Every ingest adds or replaces the samples in the input ("upsert"), so the
+# database keeps growing with each new run.
+#
+# Input:
+# 1. parsed XML file (e.g. "tmp/GenomeDetective_results-xml.csv") as generated by bin/GenomeDetective_XML_parser.py
+# 2. data table (e.g. "tmp/bokeh_input.csv") with assignments and discoveries, as generated by bin/GenomeDetective_heatmaps.py
+#
+# Output: SQLite database with the tables:
+# - samples: one row per run and sample with the parsed XML metrics
+# - hits: one row per run, sample, taxon and assigned/discovered, with:
+#   contigs, number_of_reads, coverage, percentage_of_total_reads, percentage_of_viral_reads
+# Both are indexed on run, sample and taxon.
+#
+# Required python packages:
+#  - pandas
+#  - pyarrow (only for parquet input)
+#
+# For automatic use in snakemake. The corresponding snakemake rule should provide the input:
+#  - the parsed XML file and the data table (csv, or parquet if the name ends with ".parquet")
+#  - the database as parameter (it is kept between runs, so it is not an output)
+#  - a name for the output, which is created when the ingest is done
+#
+# To query the database, run the script from the command line, e.g.:
+#  python bin/GenomeDetective_database.py GenomeDetective_cohort.sqlite taxon "Human mastadenovirus F" --min-percentage 1
+#  python bin/GenomeDetective_database.py GenomeDetective_cohort.sqlite sample 3 1
+#  python bin/GenomeDetective_database.py GenomeDetective_cohort.sqlite runs
+
+#Import required python libraries-------------------------------
+import argparse
+import sqlite3
+import time
+import pandas as pd         #reading csv/parquet files
+from GenomeDetective_tables import read_table #csv/parquet tables
+
+
+#Set variables--------------------------------------------------
+#Metrics from the parsed XML file (see bin/GenomeDetective_XML_parser.py)
+XML_METRICS = ["total_reads", "low_quality_reads", "non_viral_reads",
+               "viral_reads", "runtime", "init_runtime", "qc1_runtime",
+               "qc2_runtime", "filtering_runtime", "high_quality_reads",
+               "qc_reads_per_second", "filtering_reads_per_second"]
+
+#Columns of the data table, and their names in the database
+HIT_COLUMNS = {"Assignment": "taxon",
+               "Assigned_Discovered": "assigned_discovered",
+               "# Contigs": "contigs",
+               "Mapped # Reads": "number_of_reads",
+               "Coverage (%)": "coverage",
+               "percentage_of_total_reads": "percentage_of_total_reads",
+               "percentage_of_viral_reads": "percentage_of_viral_reads"}
+HIT_NUMBERS = ["contigs", "number_of_reads", "coverage",
+               "percentage_of_total_reads", "percentage_of_viral_reads"]
+
+#Numbers that are counts; all others are stored as REAL
+COUNTS = ["total_reads", "low_quality_reads", "non_viral_reads",
+          "viral_reads", "high_quality_reads", "contigs", "number_of_reads"]
+
+
+#Define functions-----------------------------------------------
+def to_python(value):
+    """
+    Convert (numpy) values from a dataframe to values that
+    SQLite accepts; missing values become NULL
+    """
+    if pd.isnull(value):
+        return None
+    elif hasattr(value, "item"):
+        return value.item()
+    else:
+        return value
+
+def column_type(column):
+    """
+    SQLite type of a column: INTEGER for counts, otherwise REAL
+    """
+    if column in COUNTS:
+        return "INTEGER"
+    else:
+        return "REAL"
+
+def create_database(filename):
+    """
+    Create (or open) the cohort database, with its tables and indexes
+    """
+    connection = sqlite3.connect(filename)
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS samples (
+            run_id TEXT NOT NULL,
+            sample_id TEXT NOT NULL,
+            %s,
+            ingested_at TEXT,
+            PRIMARY KEY (run_id, sample_id)
+        )""" % ",\n            ".join([ "%s %s" % (metric, column_type(metric))
+                                      for metric in XML_METRICS ]))
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS hits (
+            run_id TEXT NOT NULL,
+            sample_id TEXT NOT NULL,
+            taxon TEXT NOT NULL COLLATE NOCASE,
+            assigned_discovered TEXT NOT NULL,
+            %s,
+            PRIMARY KEY (run_id, sample_id, taxon, assigned_discovered)
+        )""" % ",\n            ".join([ "%s %s" % (number, column_type(number))
+                                      for number in HIT_NUMBERS ]))
+    connection.execute("""CREATE INDEX IF NOT EXISTS samples_sample
+        ON samples (sample_id)""")
+    connection.execute("""CREATE INDEX IF NOT EXISTS hits_sample
+        ON hits (sample_id)""")
+    connection.execute("""CREATE INDEX IF NOT EXISTS hits_taxon
+        ON hits (taxon, percentage_of_total_reads)""")
+
+    return(connection)
+
+def ingest(connection, parsed_xml, data_table):
+    """
+    Input: connection to the database, parsed XML file and data table
+    Output: number of samples ingested
+
+    Samples that are already in the database are replaced,
+    including all their hits.
+    """
+    xml_df = read_table(parsed_xml)
+    hits_df = read_table(data_table, columns = ["run_id", "sample_id"] +
+                         list(HIT_COLUMNS.keys()))
+    hits_df = hits_df.dropna(subset = ["Assignment"]).rename(columns = HIT_COLUMNS)
+    ingested_at = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    sample_rows = []
+    for _, row in xml_df.iterrows():
+        sample_rows.append([str(row["run_id"]), str(row["sample_id"])] +
+                           [ to_python(row[metric]) if metric in row else None
+                             for metric in XML_METRICS ] +
+                           [ingested_at])
+
+    hit_rows = []
+    for _, row in hits_df.iterrows():
+        hit_rows.append([str(row["run_id"]), str(row["sample_id"]),
+                         row["taxon"], row["assigned_discovered"]] +
+                        [ to_python(row[number]) for number in HIT_NUMBERS ])
+
+    with connection:
+        #One transaction: the database never has half an ingest
+        connection.executemany("DELETE FROM hits WHERE run_id = ? AND sample_id = ?",
+                               [ row[:2] for row in sample_rows ])
+        connection.executemany("INSERT OR REPLACE INTO samples VALUES (%s)" %
+                               ", ".join(["?"] * (len(XML_METRICS) + 3)),
+                               sample_rows)
+        connection.executemany("INSERT OR REPLACE INTO hits VALUES (%s)" %
+                               ", ".join(["?"] * (len(HIT_NUMBERS) + 4)),
+                               hit_rows)
+
+    return(len(sample_rows))
+
+def print_query(connection, query, parameters = ()):
+    """
+    Run a query and print the results as a tab-separated table
+    """
+    cursor = connection.execute(query, parameters)
+    print('\t'.join([ column[0] for column in cursor.description ]))
+    for row in cursor:
+        print('\t'.join([ "" if value is None else str(value) for value in row ]))
+
+    return(None)
+
+
+#Script execution------------------------------------------------
+if __name__ == "__main__":
+    if "snakemake" in globals():
+        #Ingest step of the pipeline
+        PARSED_XML = snakemake.input['parsed_xml']
+        DATA_TABLE = snakemake.input['data_table']
+        DATABASE = snakemake.params['database']
+        OUTPUT_FILE = snakemake.output[0]
+
+        connection = create_database(DATABASE)
+        number_of_samples = ingest(connection, PARSED_XML, DATA_TABLE)
+        connection.close()
+
+        with open(OUTPUT_FILE, 'w') as done:
+            done.write("%i samples ingested into %s\n" % (number_of_samples, DATABASE))
+
+        print("""\nDone!
+%i samples have been written to: %s""" % (number_of_samples, DATABASE))
+
+    else:
+        #Query the database from the command line
+        parser = argparse.ArgumentParser(
+            description = "Query the Genome Detective cohort database")
+        parser.add_argument("database", help = "cohort database (.sqlite)")
+        subparsers = parser.add_subparsers(dest = "query")
+
+        taxon_parser = subparsers.add_parser("taxon",
+            help = "samples in which a taxon was found")
+        taxon_parser.add_argument("taxon", help = "taxon (not case-sensitive)")
+        taxon_parser.add_argument("--min-percentage", type = float, default = 0,
+            help = "minimal percentage of total reads (default: 0)")
+
+        sample_parser = subparsers.add_parser("sample",
+            help = "metrics and taxa of one sample")
+        sample_parser.add_argument("run_id", help = "run ID")
+        sample_parser.add_argument("sample_id", help = "sample ID")
+
+        subparsers.add_parser("runs", help = "list runs and their number of samples")
+
+        args = parser.parse_args()
+        connection = sqlite3.connect(args.database)
+
+        if args.query == "taxon":
+            print_query(connection, """SELECT run_id, sample_id, taxon,
+                assigned_discovered, number_of_reads, percentage_of_total_reads
+                FROM hits WHERE taxon = ? AND percentage_of_total_reads >= ?
+                ORDER BY percentage_of_total_reads DESC""",
+                (args.taxon, args.min_percentage))
+        elif args.query == "sample":
+            print_query(connection, """SELECT * FROM samples
+                WHERE run_id = ? AND sample_id = ?""",
+                (args.run_id, args.sample_id))
+            print("")
+            print_query(connection, """SELECT taxon, assigned_discovered,
+                contigs, number_of_reads, coverage, percentage_of_total_reads,
+                percentage_of_viral_reads FROM hits
+                WHERE run_id = ? AND sample_id = ?
+                ORDER BY percentage_of_total_reads DESC""",
+                (args.run_id, args.sample_id))
+        elif args.query == "runs":
+            print_query(connection, """SELECT run_id, COUNT(*) AS samples,
+                MAX(ingested_at) AS ingested_at FROM samples
+                GROUP BY run_id ORDER BY run_id""")
+        else:
+            parser.print_help()
+
+        connection.close()
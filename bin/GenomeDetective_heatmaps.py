@@ -31,23 +31,42 @@
 # - assigned taxa
 # - discovered taxa
 # - assigned and discovered taxa (together in the same map)
+# Or, instead, the same heatmaps as static images (png or svg),
+#  which are drawn without Bokeh or a browser
+# 
+# Sample comparison (of assigned and discovered taxa together):
+# - sparse sample x taxon matrix of the percentage of total reads (npz)
+# - pairwise Bray-Curtis and Jaccard distances between samples (npy),
+#    rows and columns are in the same order as the samples in the matrix
+# - table of the nearest neighbours of each sample (csv)
 # 
 # Required python packages:
 #  - pandas
 #  - bokeh
+#  - scipy
+#  - matplotlib
+#  - pyarrow (only for parquet input/output)
 #  
 # For automatic use in snakemake. The corresponding snakemake rule should provide the input:
-#  - the parsed XML file ("tmp/GenomeDetective_results.csv")
+#  - the parsed XML file ("tmp/GenomeDetective_results.csv", or ".parquet")
 #  - a list of CSV files (their names, as strings; e.g. [ "1_a_results.csv", "1_b_results.csv" ]; also for the discovery)
 #  - a name for the output files
+#    The data table is written as parquet if its name ends with ".parquet", otherwise as csv.
 
 
 #Import all required libraries---------------------------------
 import numpy as np
 import pandas as pd
+from GenomeDetective_tables import read_table, write_table #csv/parquet tables
 from bokeh.plotting import figure, show, output_file
 from bokeh.models import HoverTool, ColumnDataSource
 from bokeh.io import output_notebook
+from scipy import sparse
+from scipy.spatial.distance import cdist
+import matplotlib
+matplotlib.use("Agg")       #draw static heatmaps without a display
+import matplotlib.pyplot as plt
+from matplotlib.colors import to_rgb
 from sys import argv
 
 
@@ -59,13 +78,34 @@ if len(argv) > 1:
 else:
     COLOUR = ["#6b2d18"] #Selected from coffee beans: http://s.eatthis-cdn.com/media/images/ext/851818315/coffee-beans.jpg
 
-ASSIGNMENTS = snakemake.input['assignments']
-DISCOVERIES = snakemake.input['discoveries']
-PARSED_XML = snakemake.input['parsed_xml']
-MAP_A = snakemake.output['heatmap_a']
-MAP_D = snakemake.output['heatmap_d']
-MAP_AD = snakemake.output['heatmap_ad']
-OUTPUT_FILE = snakemake.output['data_table']
+#Which inputs and outputs are given depends on the Snakefile rule:
+# - create_heatmaps: build the data table from the Genome Detective files,
+#    write it and create the heatmaps (html or static images) and
+#    sample comparisons
+# - create_data_table_run (sharded by run): only build and write the
+#    data table of one run
+# - create_heatmaps (sharded by run): read the merged data table of all
+#    runs and create the heatmaps and sample comparisons
+ASSIGNMENTS = getattr(snakemake.input, 'assignments', None)
+DISCOVERIES = getattr(snakemake.input, 'discoveries', None)
+PARSED_XML = getattr(snakemake.input, 'parsed_xml', None)
+INPUT_TABLE = getattr(snakemake.input, 'data_table', None)
+MAP_A = getattr(snakemake.output, 'heatmap_a', None)
+MAP_D = getattr(snakemake.output, 'heatmap_d', None)
+MAP_AD = getattr(snakemake.output, 'heatmap_ad', None)
+STATIC_A = getattr(snakemake.output, 'static_a', None)
+STATIC_D = getattr(snakemake.output, 'static_d', None)
+STATIC_AD = getattr(snakemake.output, 'static_ad', None)
+OUTPUT_FILE = getattr(snakemake.output, 'data_table', None)
+MATRIX = getattr(snakemake.output, 'abundance_matrix', None)
+BRAY_CURTIS = getattr(snakemake.output, 'bray_curtis', None)
+JACCARD = getattr(snakemake.output, 'jaccard', None)
+NEIGHBOURS = getattr(snakemake.output, 'neighbours', None)
+NUMBER_OF_NEIGHBOURS = int(getattr(snakemake.params, 'neighbours', 5))
+
+#Distances are calculated in blocks of samples, so that large cohorts
+# fit in memory: this is the (approximate) number of cells per block
+BLOCK_CELLS = 10**7
 
 
 #Functions for parsing, dataframe building and heatmap creation
@@ -105,13 +145,18 @@ def create_concatenated_dataframe(csv_list):
     df_list = []
     for results_file in csv_list:
         results_df = pd.read_csv(results_file)
-        results_df = results_df.drop("Contigs", axis = 1) #remove unnecessary (and long!) column
+        results_df = results_df.drop("Contigs", axis = 1) #remove unnecessary (and long!) column, see bin/GenomeDetective_contig_store.py
         run_id, sample_id = pull_sample_name(results_file)
         results_df["run_id"] = run_id
         results_df["sample_id"] = sample_id
         df_list.append(results_df)
 
     #Step 3: concatenate the dataframes
+    # (a run may have no files of one kind, e.g. no discoveries)
+    if not df_list:
+        return(pd.DataFrame(columns = ["Assignment", "# Contigs", "Mapped # Reads",
+                                       "Coverage (%)", "Mapped depth <br/>of Coverage",
+                                       "run_id", "sample_id"]))
     super_df = pd.concat(df_list, ignore_index=True)
     
     return(super_df)
@@ -136,12 +181,43 @@ def calculate_fractions(dataframe):
 
     return(dataframe)
 
+def create_data_table(assignment_files, discovery_files, parsed_xml):
+    """
+    Input: lists of Genome Detective assignment and discovery
+        CSV files, parsed XML file
+    Output: Dataframe with all data on which the heatmaps are based
+    """
+    #Prepare dataframes
+    assignments = create_concatenated_dataframe(assignment_files)
+    assignments["Assigned_Discovered"] = "Assigned"
+
+    discoveries = create_concatenated_dataframe(discovery_files)
+    discoveries["Assigned_Discovered"] = "Discovered"
+
+    #Concatenate these two (assignments and discoveries)
+    results_df = pd.concat([assignments, discoveries], ignore_index=True)
+    results_df["run_id"] = results_df["run_id"].apply(int)
+    
+    xml_df = read_table(parsed_xml)
+    
+    #Merge into one dataframe
+    super_df = results_df.merge(xml_df, on = ["run_id", "sample_id"], how = "right")
+
+    #Calculate fractions and percentages of total/viral reads
+    super_df = calculate_fractions(super_df)
+
+    #For easy use in the heatmaps, create a column that combines run_id + sample_id
+    super_df["sample"] = super_df["run_id"].map(str) + '_' + super_df["sample_id"].map(str)
+    
+    return(super_df)
+
 def create_heatmaps(dataframe):
     """
     Input: Dataframe with all required data:
         Taxon, number of reads, assigned/discovered
     Output: 3 heatmaps (assigned/discovered/both), as html files
-            csv file with the data
+            or as static images (png/svg; depending on the outputs
+            given by the Snakefile)
     """
     
     def create_heatmap(subset_df, title, filename):
@@ -216,46 +292,281 @@ def create_heatmaps(dataframe):
         show(p)
         return(None)
     
+    def create_static_heatmap(subset_df, title, filename):
+        """
+        Draw the same heatmap as create_heatmap() as a static image
+        (png or svg, by file extension), from a dense taxon x sample
+        array of colours and alphas. No browser is needed.
+        """
+        samples = sorted(set(subset_df["sample"]))
+        hits = subset_df.dropna(subset = ["Assignment"])
+        taxa = sorted(set(hits["Assignment"])) #sorted 'from top to bottom'
+        percent_of_total = hits["percentage_of_total_reads"].fillna(0).values.astype(float)
+
+        #Without taxa (e.g. no discovery files), there is nothing to draw:
+        # write an empty image with the title, so the other outputs follow
+        if not taxa or not samples:
+            fig = plt.figure(figsize = (6, 2))
+            fig.text(0.5, 0.7, title, color = COLOUR[0], fontsize = 16,
+                     ha = "center")
+            fig.text(0.5, 0.3, "No taxa found", fontsize = 12, ha = "center")
+            fig.savefig(filename)
+            plt.close(fig)
+            print("No taxa found for the static heatmap %s, an empty image has been written to: %s" % (title, filename))
+            return(None)
+
+        #Same alphas as in the interactive heatmap
+        max_load = max(percent_of_total) if len(percent_of_total) else 0
+        if max_load > 0:
+            alphas = np.minimum(percent_of_total / float(max_load), 0.9) + 0.1
+        else:
+            alphas = np.full(len(percent_of_total), 0.1)
+        
+        rows = pd.Categorical(hits["Assignment"], categories = taxa).codes
+        columns = pd.Categorical(hits["sample"], categories = samples).codes
+        image = np.zeros((len(taxa), len(samples), 4))
+        image[:, :, :3] = to_rgb(COLOUR[0])
+        #A taxon may be both assigned and discovered: show the strongest
+        np.maximum.at(image[:, :, 3], (rows, columns), alphas)
+        
+        if len(taxa) > 15:
+            fontsize = 10
+        else:
+            fontsize = 12
+        
+        #Leave room for the labels (in inches, estimated from their length),
+        # so the figure only has to be drawn once
+        char_width = fontsize / 72. * 0.6
+        left = max([ len(str(taxon)) for taxon in taxa ] + [1]) * char_width + 0.3
+        top = max([ len(str(sample)) for sample in samples ] + [1]) * char_width * 0.71 + 0.8
+        right = max([ len(str(sample)) for sample in samples ] + [1]) * char_width * 0.71 + 0.2
+        width = min(max(6, 0.2 * len(samples)), 200) + left + right
+        height = min(max(4, 0.2 * len(taxa)), 200) + top + 0.2
+        fig = plt.figure(figsize = (width, height))
+        ax = fig.add_axes([left / width, 0.2 / height,
+                           1 - (left + right) / width, 1 - (top + 0.2) / height])
+        ax.imshow(image, aspect = "auto", interpolation = "nearest")
+        
+        ax.xaxis.tick_top()
+        ax.set_xticks(np.arange(len(samples)))
+        ax.set_xticklabels(samples, rotation = 45, ha = "left",
+                           fontsize = fontsize)
+        ax.set_yticks(np.arange(len(taxa)))
+        ax.set_yticklabels(taxa, fontsize = fontsize)
+        ax.tick_params(length = 0)
+        for spine in ax.spines.values():
+            spine.set_visible(False)
+        ax.set_title(title, color = COLOUR[0], fontsize = 16, loc = "right")
+        
+        fig.savefig(filename)
+        plt.close(fig)
+        print("The static heatmap %s has been created and written to: %s" % (title, filename))
+        return(None)
+    
     #Create an extra column that is the combination of run ID and sample ID:
     dataframe["sample"] = dataframe["run_id"].map(str) + '_' + dataframe["sample_id"].map(str)
     
     #Create heatmaps
     assignments = dataframe[dataframe.Assigned_Discovered == "Assigned"]
-    create_heatmap(assignments, "GenomeDetective assignments", MAP_A)
-    
     discoveries = dataframe[dataframe.Assigned_Discovered == "Discovered"]
-    create_heatmap(discoveries, "GenomeDetective discoveries", MAP_D)
     
-    create_heatmap(dataframe, "GenomeDetective assignments+discoveries", MAP_AD)
+    if MAP_A:
+        create_heatmap(assignments, "GenomeDetective assignments", MAP_A)
+        create_heatmap(discoveries, "GenomeDetective discoveries", MAP_D)
+        create_heatmap(dataframe, "GenomeDetective assignments+discoveries", MAP_AD)
+    
+    #Static images skip Bokeh (and the browser) altogether
+    if STATIC_A:
+        create_static_heatmap(assignments, "GenomeDetective assignments", STATIC_A)
+        create_static_heatmap(discoveries, "GenomeDetective discoveries", STATIC_D)
+        create_static_heatmap(dataframe, "GenomeDetective assignments+discoveries", STATIC_AD)
     
     return(None)
 
 
-#Script execution----------------------------------------------
-if __name__ == "__main__":
-    #Prepare dataframes
-    assignments = create_concatenated_dataframe(ASSIGNMENTS)
-    assignments["Assigned_Discovered"] = "Assigned"
+def create_abundance_matrix(dataframe):
+    """
+    Input: Dataframe with columns "sample", "Assignment" and
+        "percentage_of_total_reads"
+    Output: sparse (CSR) matrix of samples (rows) x taxa (columns)
+        with the percentage of total reads,
+        sorted list of samples, sorted list of taxa
+    
+    Samples without any taxon stay in the matrix as empty rows.
+    If a taxon occurs more than once in a sample (e.g. both assigned
+    and discovered), the percentages are added up.
+    """
+    samples = sorted(set(dataframe["sample"]))
+    hits = dataframe.dropna(subset = ["Assignment"])
+    taxa = sorted(set(hits["Assignment"]))
+    
+    rows = pd.Categorical(hits["sample"], categories = samples).codes
+    columns = pd.Categorical(hits["Assignment"], categories = taxa).codes
+    values = hits["percentage_of_total_reads"].fillna(0).values.astype(float)
+    
+    matrix = sparse.coo_matrix((values, (rows, columns)),
+                               shape = (len(samples), len(taxa))).tocsr()
+    #converting to CSR adds up duplicate entries
+    
+    return(matrix, samples, taxa)
 
-    discoveries = create_concatenated_dataframe(DISCOVERIES)
-    discoveries["Assigned_Discovered"] = "Discovered"
+def save_abundance_matrix(matrix, samples, taxa, filename):
+    """
+    Save the sparse matrix with its row (sample) and column (taxon)
+    labels in one compressed numpy (.npz) file. It can be loaded with:
+    
+    data = np.load(filename)
+    matrix = sparse.csr_matrix((data["data"], data["indices"], data["indptr"]),
+                               shape = data["shape"])
+    """
+    np.savez_compressed(filename, data = matrix.data,
+                        indices = matrix.indices, indptr = matrix.indptr,
+                        shape = matrix.shape, samples = np.array(samples),
+                        taxa = np.array(taxa))
+    print("The sample x taxon matrix has been written to: %s" % filename)
+    return(None)
 
-    #Concatenate these two (assignments and discoveries)
-    results_df = pd.concat([assignments, discoveries], ignore_index=True)
-    results_df["run_id"] = results_df["run_id"].apply(int)
+def bray_curtis_block(matrix, start, stop, block_size):
+    """
+    Bray-Curtis distances between samples start:stop and all samples:
+    sum(|u - v|) / sum(u + v)
     
-    xml_df = pd.read_csv(PARSED_XML)
+    The distances are calculated by scipy (cdist), on dense sub-blocks
+    of block_size samples, with only the taxa found in either sub-block.
+    """
+    rows = matrix[start:stop]
+    distances = np.zeros((stop - start, matrix.shape[0]))
     
-    #Merge into one dataframe
-    super_df = results_df.merge(xml_df, on = ["run_id", "sample_id"], how = "right")
+    for other_start in range(0, matrix.shape[0], block_size):
+        other_stop = min(other_start + block_size, matrix.shape[0])
+        others = matrix[other_start:other_stop]
+        taxa = np.union1d(rows.indices, others.indices)
+        if len(taxa) == 0:
+            continue #all samples empty: distance 0
+        
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            distances[:, other_start:other_stop] = cdist(
+                rows[:, taxa].toarray(), others[:, taxa].toarray(), "braycurtis")
+    
+    #two empty samples are identical: give them distance 0
+    distances[np.isnan(distances)] = 0
+    
+    return(distances)
 
-    #Calculate fractions and percentages of total/viral reads
-    super_df = calculate_fractions(super_df)
+def jaccard_block(presence, counts, start, stop):
+    """
+    Jaccard distances (presence/absence of taxa) between samples
+    start:stop and all samples:
+    1 - |shared taxa| / |taxa in either sample|
+    """
+    intersection = (presence[start:stop] * presence.T).toarray()
+    union = counts[start:stop, np.newaxis] + counts[np.newaxis, :] - intersection
+    #two empty samples are identical: give them distance 0
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        distances = np.where(union > 0, 1 - intersection / union, 0)
+    
+    return(distances)
 
-    #For easy use in the heatmaps, create a column that combines run_id + sample_id
-    super_df["sample"] = super_df["run_id"].map(str) + '_' + super_df["sample_id"].map(str)
+def nearest_neighbours(distances, start, samples, metric):
+    """
+    Input: block of distances (rows: samples from start onwards,
+        columns: all samples), list of all samples, name of the metric
+    Output: dataframe with the closest samples (excluding the sample
+        itself) for each sample in the block
+    """
+    number = min(NUMBER_OF_NEIGHBOURS, len(samples) - 1)
+    block_size = distances.shape[0]
+    
+    if number < 1:
+        return(pd.DataFrame())
+    
+    distances = distances.copy()
+    rows = np.arange(block_size)
+    distances[rows, rows + start] = np.inf #do not pick the sample itself
     
-    create_heatmaps(super_df)
+    closest = np.argpartition(distances, number - 1, axis = 1)[:, :number]
+    closest_distances = distances[rows[:, np.newaxis], closest]
+    order = np.argsort(closest_distances, axis = 1)
+    closest = closest[rows[:, np.newaxis], order]
+    closest_distances = closest_distances[rows[:, np.newaxis], order]
+    
+    samples = np.array(samples)
+    neighbours_df = pd.DataFrame(
+        {"sample": np.repeat(samples[start:start + block_size], number),
+         "metric": metric,
+         "rank": np.tile(np.arange(1, number + 1), block_size),
+         "neighbour": samples[closest.ravel()],
+         "distance": closest_distances.ravel()})
+    
+    return(neighbours_df)
+
+def compare_samples(dataframe):
+    """
+    Input: Dataframe with all required data:
+        sample, taxon, percentage of total reads
+    Output: sample x taxon matrix (npz), Bray-Curtis and Jaccard
+            distance matrices (npy), nearest neighbour table (csv)
+    
+    The distances are calculated in blocks of samples and written
+    straight to disk, so the full matrices never have to be in
+    memory at once.
+    """
+    matrix, samples, taxa = create_abundance_matrix(dataframe)
+    save_abundance_matrix(matrix, samples, taxa, MATRIX)
+    
+    number_of_samples = len(samples)
+    block_size = max(1, BLOCK_CELLS // max(number_of_samples, 1))
+    
+    presence = (matrix > 0).astype(np.float64).tocsr()
+    counts = np.asarray(presence.sum(axis = 1)).ravel()
+    
+    bray_curtis = np.lib.format.open_memmap(BRAY_CURTIS, mode = "w+",
+        dtype = np.float32, shape = (number_of_samples, number_of_samples))
+    jaccard = np.lib.format.open_memmap(JACCARD, mode = "w+",
+        dtype = np.float32, shape = (number_of_samples, number_of_samples))
+    
+    neighbour_list = []
+    for start in range(0, number_of_samples, block_size):
+        stop = min(start + block_size, number_of_samples)
+        
+        distances = bray_curtis_block(matrix, start, stop, block_size)
+        bray_curtis[start:stop] = distances
+        neighbour_list.append(nearest_neighbours(distances, start, samples,
+                                                 "bray-curtis"))
+        
+        distances = jaccard_block(presence, counts, start, stop)
+        jaccard[start:stop] = distances
+        neighbour_list.append(nearest_neighbours(distances, start, samples,
+                                                 "jaccard"))
+    
+    bray_curtis.flush()
+    jaccard.flush()
+    print("The Bray-Curtis distances have been written to: %s" % BRAY_CURTIS)
+    print("The Jaccard distances have been written to: %s" % JACCARD)
+    
+    columns = ["sample", "metric", "rank", "neighbour", "distance"]
+    neighbours_df = pd.concat(neighbour_list + [pd.DataFrame(columns = columns)],
+                              ignore_index = True)[columns]
+    neighbours_df = neighbours_df.sort_values(["metric", "sample", "rank"])
+    neighbours_df.to_csv(NEIGHBOURS, index = False)
+    print("The nearest neighbours of each sample have been written to: %s" % NEIGHBOURS)
+    
+    return(None)
+
+
+#Script execution----------------------------------------------
+if __name__ == "__main__":
+    if INPUT_TABLE:
+        #The data table has already been built (per run) and merged
+        super_df = read_table(INPUT_TABLE)
+    else:
+        super_df = create_data_table(ASSIGNMENTS, DISCOVERIES, PARSED_XML)
+    
+    if MAP_A or STATIC_A:
+        create_heatmaps(super_df)
+        
+        compare_samples(super_df)
     
-    super_df.to_csv(OUTPUT_FILE, index = False)
-    print("The table with all the data on which the heatmaps are based has been written to %s" % OUTPUT_FILE)
\ No newline at end of file
+    if OUTPUT_FILE:
+        write_table(super_df, OUTPUT_FILE)
+        print("The table with all the data on which the heatmaps are based has been written to %s" % OUTPUT_FILE)
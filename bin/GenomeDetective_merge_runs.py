@@ -0,0 +1,63 @@
+
+# coding: utf-8
+
+# # Genome Detective run merging script
+# 
+# When the workflow is split up by run ID (`--config shard_by_run=True`),
+# the parsed XML, the report and the data table for the heatmaps are made
+# for each run separately, in "tmp/runs/[run_id]/". This script combines
+# the tables of all runs into the cohort-wide table.
+# 
+# Input: tables of the same kind, one per run (e.g. [ "tmp/runs/3/bokeh_input.csv", "tmp/runs/4/bokeh_input.csv" ])
+# 
+# Output: one table with the rows of all runs (e.g. "tmp/bokeh_input.csv")
+#    Tables are read and written as parquet if their names end with ".parquet", otherwise as csv.
+# 
+# Required python packages:
+#  - pandas
+#  - pyarrow (only for parquet input/output)
+#  
+# For automatic use in snakemake. The corresponding snakemake rule should provide the input:
+#  - a list of tables (one for each run)
+#  - a name for the output
+
+#Import required python libraries-------------------------------
+import pandas as pd         #dataframe and csv export
+from GenomeDetective_tables import read_table, write_table #csv/parquet tables
+
+RUN_TABLES = snakemake.input
+OUTPUT_FILE = snakemake.output[0]
+
+#Define functions-----------------------------------------------
+def merge_tables(table_list):
+    """
+    Input: a list of tables of the same kind, one per run
+    Output: one concatenated dataframe, in the order of the input,
+        with all columns of all tables
+    
+    Some runs lack columns (e.g. a run with only XML files has no
+    identity columns), so the columns follow the most complete table
+    first, and the order of the runs does not matter.
+    """
+    df_list = [ read_table(table) for table in table_list ]
+    
+    columns = []
+    for dataframe in sorted(df_list, key = lambda df: len(df.columns), reverse = True):
+        columns += [ column for column in dataframe.columns if column not in columns ]
+    
+    merged_df = pd.concat(df_list, ignore_index = True, sort = False)
+    merged_df = merged_df[columns]
+    
+    return(merged_df)
+
+
+#Script execution------------------------------------------------
+if __name__ == "__main__":
+    print("Merging %i tables into: %s" % (len(RUN_TABLES), OUTPUT_FILE))
+    
+    merged_df = merge_tables(RUN_TABLES)
+    
+    write_table(merged_df, OUTPUT_FILE)
+    
+    print("""\nDone!
+The results have been written to: %s""" % OUTPUT_FILE)
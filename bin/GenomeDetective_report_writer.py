@@ -38,14 +38,16 @@
 # 
 # Required python packages:
 #  - pandas
+#  - pyarrow (only for parquet input)
 #  
 # For automatic use in snakemake. The corresponding snakemake rule should provide the input:
-#  - the parsed XML file ("tmp/GenomeDetective_results.csv")
+#  - the parsed XML file ("tmp/GenomeDetective_results.csv", or ".parquet")
 #  - a list of CSV files (their names, as strings; e.g. [ "1_a_results.csv", "1_b_results.csv" ]
 #  - a name for the output (e.g. "tmp/GenomeDetective-PCR_summary.csv")
 
 ###Import required python libraries------------------------
 import pandas as pd         #dataframe and csv export
+from GenomeDetective_tables import read_table #csv/parquet tables
 
 CSV_FILES = snakemake.input['csv']
 PARSED_XML = snakemake.input['parsed_xml']
@@ -88,13 +90,18 @@ def create_concatenated_dataframe(csv_list):
     df_list = []
     for results_file in csv_list:
         results_df = pd.read_csv(results_file)
-        results_df = results_df.drop("Contigs", axis = 1) #remove unnecessary (and long!) column
+        results_df = results_df.drop("Contigs", axis = 1) #remove unnecessary (and long!) column, see bin/GenomeDetective_contig_store.py
         run_id, sample_id = pull_sample_name(results_file)
         results_df["run_id"] = run_id
         results_df["sample_id"] = sample_id
         df_list.append(results_df)
 
     #Step 3: concatenate the dataframes
+    # (a run may have no result files, e.g. when nothing was assigned)
+    if not df_list:
+        return(pd.DataFrame(columns = ["Assignment", "# Contigs", "Mapped # Reads",
+                                       "Coverage (%)", "Mapped depth <br/>of Coverage",
+                                       "run_id", "sample_id"]))
     super_df = pd.concat(df_list, ignore_index=True)
     
     return(super_df)
@@ -108,7 +115,7 @@ def combine_tables(parsed_xml, csv_list):
     Output: one table with the fields:
     run_id sample_id total_reads low_quality_reads non_viral_reads viral_reads  pcr_result ct_value ngs_results coverage% contigs number_of_reads fraction_of_total_reads fraction_of_viral_reads pcr_ngs_congruence pcr_ngs_comments human_virus_reads plant_virus_reads phage_reads other_viral_reads runtime
     """
-    xml_df = pd.read_csv(parsed_xml)
+    xml_df = read_table(parsed_xml)
     csv_df = create_concatenated_dataframe(csv_list)
     csv_df["run_id"] = csv_df["run_id"].apply(int)
     #This column was read as strings and could not merge with
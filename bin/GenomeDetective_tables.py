@@ -0,0 +1,94 @@
+
+# coding: utf-8
+
+# # Genome Detective intermediate tables
+#
+# Reading and writing of the intermediate tables in tmp/ (and the
+# per-run tables in tmp/runs/), shared by the scripts in this folder.
+# The format follows the file extension:
+#  - ".parquet" for parquet (columnar, keeps column types)
+#  - anything else for csv
+#
+# Required python packages:
+#  - pandas
+#  - pyarrow (only for parquet)
+#
+# Usage, from another script in bin/:
+#  from GenomeDetective_tables import read_table, write_table
+
+#Import required python libraries-------------------------------
+import pandas as pd         #dataframe and csv export
+
+
+#Set variables--------------------------------------------------
+#Types of the ID columns, which are used to merge tables: sample IDs come
+# from the filenames (as strings), so "1" must not be read as a number
+ID_TYPES = {"run_id": int, "sample_id": str, "sample": str}
+
+#When only some rows are needed, csv tables are read in chunks of this
+# many rows, so the rest of the table is never in memory all at once
+CSV_CHUNK_ROWS = 10**5
+
+
+#Define functions-----------------------------------------------
+def set_id_types(dataframe):
+    """
+    Give the ID columns that are in the dataframe their types
+    (see ID_TYPES)
+    """
+    for column, column_type in ID_TYPES.items():
+        if column in dataframe:
+            dataframe[column] = dataframe[column].astype(column_type)
+
+    return(dataframe)
+
+def select_rows(dataframe, rows):
+    """
+    Keep the rows that have the given values, e.g. {"sample": "3_1"}
+    """
+    for column, value in rows.items():
+        dataframe = dataframe[dataframe[column] == value]
+
+    return(dataframe)
+
+def read_table(filename, columns = None, rows = None):
+    """
+    Read an intermediate table, in the format that matches
+    the file extension.
+    Optionally, read only a selection of columns, and only the rows
+    with the given values (e.g. rows = {"sample": "3_1"}).
+    The ID columns always get the same types (see ID_TYPES).
+    """
+    if filename.endswith(".parquet"):
+        if rows:
+            #pyarrow skips the other rows while reading
+            dataframe = pd.read_parquet(filename, columns = columns,
+                filters = [ (column, "==", value)
+                            for column, value in rows.items() ])
+        else:
+            dataframe = pd.read_parquet(filename, columns = columns)
+        chunks = [dataframe]
+    elif rows:
+        chunks = pd.read_csv(filename, usecols = columns,
+                             dtype = {"sample_id": str, "sample": str},
+                             chunksize = CSV_CHUNK_ROWS)
+    else:
+        chunks = [pd.read_csv(filename, usecols = columns,
+                              dtype = {"sample_id": str, "sample": str})]
+
+    df_list = [ select_rows(set_id_types(chunk), rows or {}) for chunk in chunks ]
+    dataframe = pd.concat(df_list, ignore_index = True)
+
+    return(dataframe)
+
+def write_table(dataframe, filename):
+    """
+    Write an intermediate table, in the format that matches
+    the file extension.
+    """
+    if filename.endswith(".parquet"):
+        dataframe.reset_index(drop = True).to_parquet(filename)
+    else:
+        dataframe.to_csv(filename, index = False)
+
+    return(None)
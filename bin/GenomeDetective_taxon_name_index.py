@@ -0,0 +1,70 @@
+
+# coding: utf-8
+
+# # Taxon name index for the CAMI profiling conversion
+#
+# Genome Detective reports taxa by name, sometimes with additions like
+# " (segment 1)" or " strain X", or with different capitals and
+# punctuation than the NCBI taxonomy. This script builds an index of
+# normalised names (lower case, without punctuation) of all viruses in the
+# NCBI taxonomy, including their synonyms, once. The CAMI profiling
+# conversion then resolves names with a dictionary lookup instead of
+# querying the taxonomy database for every name.
+#
+# Input: NCBI taxonomy DB (through ETE toolkit, see [this tutorial](http://etetoolkit.org/docs/2.3/tutorial/tutorial_ncbitaxonomy.html))
+#
+# Output: pickled dictionary { normalised name : taxid } (e.g. "tmp/ncbi_name-index.pickle")
+#
+# Required python packages:
+#  - ete3
+#
+# For automatic use in snakemake. The corresponding snakemake rule should provide:
+#  - a name for the output
+
+#Import required python libraries-------------------------------
+import pickle
+from GenomeDetective_taxon_names import normalise_name #shared with the CAMI conversion
+from ete3 import NCBITaxa   #work with NCBI taxonomy
+
+
+#Set variables--------------------------------------------------
+OUTPUT_FILE = snakemake.output[0]
+ROOT_TAXID = 10239 #Viruses: only names below this taxon are indexed
+
+
+#Define functions-----------------------------------------------
+def create_name_index(ncbi, root_taxid):
+    """
+    Input: NCBITaxa object, taxid below which to index the names
+    Output: dictionary { normalised name : taxid }
+
+    Scientific names go first, so a synonym never replaces
+    a scientific name with the same normalised form.
+    """
+    #"track" is the lineage of a taxon, from itself to the root: "taxid,parent,...,1"
+    lineage_filter = "(species.taxid = %i OR species.track LIKE '%%,%i,%%')" % (
+        root_taxid, root_taxid)
+
+    name_index = {}
+    queries = ["SELECT species.taxid, species.spname FROM species WHERE %s ORDER BY species.taxid" % lineage_filter,
+               """SELECT synonym.taxid, synonym.spname FROM synonym
+               JOIN species ON synonym.taxid = species.taxid
+               WHERE %s ORDER BY synonym.taxid""" % lineage_filter]
+
+    for query in queries:
+        for taxid, name in ncbi.db.execute(query):
+            name_index.setdefault(normalise_name(name), int(taxid))
+
+    return(name_index)
+
+
+#Script execution------------------------------------------------
+if __name__ == "__main__":
+    ncbi = NCBITaxa()
+    name_index = create_name_index(ncbi, ROOT_TAXID)
+
+    with open(OUTPUT_FILE, 'wb') as index_file:
+        pickle.dump(name_index, index_file, protocol = pickle.HIGHEST_PROTOCOL)
+
+    print("""\nDone!
+%i taxon names have been written to: %s""" % (len(name_index), OUTPUT_FILE))
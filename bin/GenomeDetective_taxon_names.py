@@ -0,0 +1,25 @@
+
+# coding: utf-8
+
+# # Genome Detective taxon names
+#
+# Normalisation of taxon names, shared by the scripts that build
+# (bin/GenomeDetective_taxon_name_index.py) and use
+# (bin/GenomeDetective_to_CAMI-profiling.py) the taxon name index.
+# The keys of the index and the names that are looked up only match
+# if both are normalised by the same function.
+#
+# Usage, from another script in bin/:
+#  from GenomeDetective_taxon_names import normalise_name
+
+#Import required python libraries-------------------------------
+import re
+
+
+#Define functions-----------------------------------------------
+def normalise_name(name):
+    """
+    Lower case, punctuation replaced by spaces, single spaces:
+    "Human adenovirus-41" -> "human adenovirus 41"
+    """
+    return ' '.join(re.sub(r"[\W_]+", ' ', str(name).lower()).split())
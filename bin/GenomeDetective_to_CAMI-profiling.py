@@ -16,67 +16,104 @@
 #     - These data (for both the assignments and the discoveries) can be derived from: the "bokeh input", output by `GenomeDetective_heatmaps.py`
 # 
 # - NCBI taxonomy DB (through ETE toolkit, see [this tutorial](http://etetoolkit.org/docs/2.3/tutorial/tutorial_ncbitaxonomy.html))
+# - index of normalised taxon names, made by `GenomeDetective_taxon_name_index.py`
 # 
 # Output: table in [CAMI profiling format](https://github.com/bioboxes/rfc/blob/60263f34c57bc4137deeceec4c68a7f9f810f6a5/data-format/profiling.mkd)
 # 
 # Required python packages:
 #  - pandas
 #  - ete3
+#  - pyarrow (only for parquet input)
 #  
 # For automatic use in snakemake. The corresponding snakemake rule should provide the input:
-#  - the bokeh input file ("tmp/bokeh_input.csv)
+#  - the bokeh input file ("tmp/bokeh_input.csv", or ".parquet")
+#  - the taxon name index ("tmp/ncbi_name-index.pickle")
 #  - a name for the output (e.g. "results/3_1_GenomeDetective_CAMI-profiling.tsv")
+#  - a log file, to which taxon names that could not be found are written
 #  
 #   ** Remember that an output has to be generated for each sample, separately! **
 
 
 #Import required python libraries-------------------------------
-import pandas as pd         #dataframe and csv export
+from GenomeDetective_tables import read_table #csv/parquet tables
+import pickle
+import re
+from GenomeDetective_taxon_names import normalise_name #shared with the name index
 from ete3 import NCBITaxa   #work with NCBI taxonomy
 
 
 #Set variables--------------------------------------------------
-DATA_TABLE = snakemake.input[0]
+DATA_TABLE = snakemake.input['data_table']
+NAME_INDEX = snakemake.input['name_index']
 PROFILE = snakemake.output[0] #one at a time
+UNRESOLVED_LOG = snakemake.log[0]
 SAMPLE = snakemake.wildcards.sample #sample ID can also be obtained from the Snakefile
 #Extract the sample ID from the file name:
 # split on '/': remove folder name, then extract the string
 # until '_Genome', which should extract "_GenomeDetective_CAMI-profiling.tsv"
 
 #Define functions-----------------------------------------------
-def create_CAMI_profile(data_file, sample_id):
+def resolve_name(name, name_index, resolved):
+    """
+    Find the taxid of a taxon name in the name index, trying:
+     1. the whole name
+     2. the name without an addition in brackets, like " (segment 1)"
+     3. the name without a " segment ...", " strain ..." or
+        " isolate ..." suffix
+    Input: taxon name, name index, dictionary of names looked up before
+        (which is updated, also with names that were not found)
+    Output: taxid, or None if the name was not found
+    """
+    if name not in resolved:
+        without_brackets = re.sub(r"\s*\(.*$", "", name)
+        without_suffix = re.split(r"\s+(?:segment|strain|isolate)\b",
+                                  without_brackets, flags = re.IGNORECASE)[0]
+        
+        resolved[name] = None
+        for candidate in [name, without_brackets, without_suffix]:
+            key = normalise_name(candidate)
+            if key in name_index:
+                resolved[name] = name_index[key]
+                break
+    
+    return(resolved[name])
+
+def create_CAMI_profile(data_file, sample_id, name_index):
     """
     CSV Parser for converting information to the CAMI profiling
     format.
     
     Input: csv file with the required information, sample ID
-        and the name of the file to write to
+        and the taxon name index
     Output: header and contents of the CAMI profile file
-        (see format linked above)
+        (see format linked above), list of taxon names that
+        could not be found in the taxonomy (these are left out)
     """
-    dataframe = pd.read_csv(data_file)
-    subset = dataframe[dataframe["sample"] == sample_id]
-    taxa = subset["Assignment"]
+    #Only these columns and the rows of this sample are needed, which
+    # saves time and memory on large cohorts (especially with parquet input)
+    subset = read_table(data_file, columns = ["sample", "Assignment",
+                                              "percentage_of_total_reads"],
+                        rows = {"sample": sample_id})
+    taxa = subset["Assignment"].dropna() #samples may have no taxa at all
     total_percentages = subset["percentage_of_total_reads"]
     ncbi = NCBITaxa()
     
     rank_list_list = [] #save all taxonomies to find the longest
     #I use the longest, because virus taxonomy is diverse...
     output_list = [] #stores the CAMI profiles as strings
+    resolved = {} #taxids of names that were looked up already
+    unresolved = [] #names that are not in the taxonomy
     
     for name in taxa:
-        #remove names that have some addition in brackets,
-        # like " (segment 1)"
-        if ' (' in name:
-            ncbi_name = name[:name.index(' (')]
-        else:
-            ncbi_name = name
-            
-        taxon_and_id = ncbi.get_name_translator([ncbi_name])
-        #ncbi.get_name_translator() returns a dictionary { 'taxon' : [id]}
-        taxid = taxon_and_id[ncbi_name]
-        #taxid is a list with one number
-        taxid_nr = taxid[0]
+        #look up the normalised name, without additions like
+        # " (segment 1)" if needed
+        taxid_nr = resolve_name(name, name_index, resolved)
+        if taxid_nr is None:
+            if name not in unresolved:
+                unresolved.append(name)
+            continue
+        taxid = [taxid_nr]
+        #the ete3 functions below require a list of IDs
 
         rank_dict = ncbi.get_rank(taxid)
         #ncbi.get_rank() requires a list of IDs, and returns a dictionary:
@@ -115,7 +152,7 @@ def create_CAMI_profile(data_file, sample_id):
         
         output_list.append(output_line)
         
-    longest_taxonomy = '|'.join(max(rank_list_list, key = len))
+    longest_taxonomy = '|'.join(max(rank_list_list + [[]], key = len))
     
     #Read the specification for details about this header:
     #https://github.com/bioboxes/rfc/blob/60263f34c57bc4137deeceec4c68a7f9f810f6a5/data-format/profiling.mkd
@@ -127,13 +164,25 @@ def create_CAMI_profile(data_file, sample_id):
 @@TAXID\tRANK\tTAXPATH\tTAXPATHSN\tPERCENTAGE
 """ % (sample_id, longest_taxonomy)
     
-    return(header, output_list)
+    return(header, output_list, unresolved)
 
 
 #Script execution------------------------------------------------
 if __name__ == "__main__":
-    header, output_list = create_CAMI_profile(data_file = DATA_TABLE, sample_id = SAMPLE)
+    with open(NAME_INDEX, 'rb') as index_file:
+        name_index = pickle.load(index_file)
+    
+    header, output_list, unresolved = create_CAMI_profile(data_file = DATA_TABLE,
+                                                          sample_id = SAMPLE,
+                                                          name_index = name_index)
     
     with open(PROFILE, 'w') as output_table:
         output_table.write(header)
-        output_table.write('\n'.join(output_list))
\ No newline at end of file
+        output_table.write('\n'.join(output_list))
+    
+    #Report the names that could not be found, instead of stopping
+    with open(UNRESOLVED_LOG, 'w') as log_file:
+        log_file.write(''.join([ "%s\n" % name for name in unresolved ]))
+    if unresolved:
+        print("Warning: %i taxon name(s) of sample %s could not be found in the NCBI taxonomy and were left out: %s" % (len(unresolved), SAMPLE, ", ".join(unresolved)))
+        print("These names have been written to: %s" % UNRESOLVED_LOG)
\ No newline at end of file